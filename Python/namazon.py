@@ -1,28 +1,86 @@
 from search import *
+import argparse
+import functools
+import random
 import time
 
 #################
 # Problem class #
 #################
 
+# Knight-like attacks of an amazon: (column distance, row distance) pairs
+KNIGHT_OFFSETS = ((1, 4), (2, 3), (3, 2), (4, 1))
+
+
+# Symmetries of the board other than the identity, as maps of a cell
+# (col, row) of an NxN board: the attacks of an amazon are invariant under
+# all of them, so they map solutions to solutions
+SYMMETRIES = (
+    lambda N, col, row: (col, N - 1 - row),  # Vertical flip
+    lambda N, col, row: (N - 1 - col, row),  # Horizontal flip
+    lambda N, col, row: (N - 1 - col, N - 1 - row),  # Half turn
+    lambda N, col, row: (row, col),  # Main diagonal reflection
+    lambda N, col, row: (N - 1 - row, N - 1 - col),  # Anti-diagonal reflection
+    lambda N, col, row: (row, N - 1 - col),  # Quarter turn
+    lambda N, col, row: (N - 1 - row, col),  # Quarter turn the other way
+)
+
+
+@functools.lru_cache(maxsize=None)
+def attack_masks(N):
+    """Attack bitboards of an NxN board, bit r standing for row r:
+    attack_masks(N)[d][r] holds the rows attacked by an amazon at row r in
+    a column at distance d of its own, i.e. the same row, both diagonals
+    and, up to distance 4, the knight-like offsets (rows r +/- (5 - d)). An
+    amazon attacks its whole column (d = 0). Computed once per size."""
+    full = (1 << N) - 1
+    masks = [[full] * N]
+    for d in range(1, N):
+        offsets = (0, d, -d) + ((5 - d, d - 5) if d <= 4 else ())
+        masks.append([sum(1 << (r + k) for k in set(offsets) if 0 <= r + k < N) for r in range(N)])
+    return masks
+
+
 class NAmazonsProblem(Problem):
     """The problem of placing N amazons on an NxN board with none attacking
     each other. A state is represented as an N-element array, where
     a value of r in the c-th entry means there is an empress at column c,
     row r, and a value of -1 means that the c-th column has not been
     filled in yet. We fill in columns left to right.
+
+    The board has symmetries (SYMMETRIES) mapping solutions to solutions.
+    With symmetry_breaking set to "half", the first column is restricted to
+    the upper half of the rows, which halves an exhaustive search and never
+    delays a first solution. With "leader", partial states that cannot lead
+    to the lexicographically smallest of the images of their solution are
+    cut as well: every class of symmetric solutions is then found once, as
+    needed to enumerate them, but the first solution found may come later.
     """
-    def __init__(self, N):
+    def __init__(self, N, symmetry_breaking=None):
         super().__init__(tuple([-1] * N))
         self.N = N
+        self.full = (1 << N) - 1
+        self.symmetry_breaking = symmetry_breaking
+        self.upper_half = (1 << (N + 1) // 2) - 1  # Rows of the first column of a leader
+
+    @functools.cached_property
+    def attacks(self):
+        """Attack bitboards of the board (see attack_masks), built on first
+        use: their O(N^2) size only suits the boards of exhaustive search."""
+        return attack_masks(self.N)
 
     def actions(self, state):
         if state[-1] != -1:
             return []  # All columns filled; no successors
         else:
             col = state.index(-1)
-            return [row for row in range(self.N)
-                    if not self.conflicted(state, row, col)]
+            free = self.full & ~self.attacked_rows(state, col)
+            if self.symmetry_breaking and col == 0:
+                free &= self.upper_half
+            if self.symmetry_breaking != "leader":
+                return [row for row in range(self.N) if free >> row & 1]
+            return [row for row in range(self.N) if free >> row & 1
+                    and self.leader_possible(state[:col] + (row,) + state[col + 1:])]
 
     def result(self, state, row):
         col = state.index(-1)
@@ -31,23 +89,89 @@ class NAmazonsProblem(Problem):
         return tuple(new)
 
     def goal_test(self, state):
-        if state[-1] == -1:
+        """All columns filled and no two amazons sharing a row or a diagonal
+        or a knight-like offset apart, checked in O(N)."""
+        if state[-1] == -1 or -1 in state:
             return False
-        return not any(self.conflicted(state, state[col], col)
-                       for col in range(len(state)))
+        N = len(state)
+        if len(set(state)) < N or len({row - col for col, row in enumerate(state)}) < N \
+                or len({row + col for col, row in enumerate(state)}) < N:
+            return False
+        return not any(col + d < N and abs(state[col + d] - row) == k
+                       for col, row in enumerate(state) for d, k in KNIGHT_OFFSETS)
 
     def h(self, node):
-        num_conflicts = 0
-        for (r1, c1) in enumerate(node.state):
-            for (r2, c2) in enumerate(node.state):
-                if (r1, c1) != (r2, c2):
-                    num_conflicts += self.conflict(r1, c1, r2, c2)
+        """Carried incrementally from node to node: a node keeps the number
+        of attacking pairs of its amazons, the bitboard of the attacked rows
+        of every column, the number of unfilled columns without a legal row
+        left (dead) and the free cells of the unfilled columns, and extends
+        those of its parent with the one amazon it adds, in O(N). Nodes are
+        ordered by conflicts and dead columns first, then by the unfilled
+        columns (every solution is at depth N, the deepest nodes come first),
+        then by the free cells (the fewest first, exposing dead ends early)."""
+        N = self.N
+        parent = node.parent
+        if parent is None:
+            node.conflicts, node.dead = 0, 0
+            node.attacked = [0] * N
+            node.free = sum(N for row in node.state if row == -1)
+        else:
+            if not hasattr(parent, "attacked"):
+                self.h(parent)
+            col = parent.state.index(-1)
+            row = node.state[col]
+            attacks = self.attacks
+            full = self.full
+            attacked = list(parent.attacked)
+            conflicts, dead = parent.conflicts, parent.dead
+            free = parent.free - bin(full & ~attacked[col]).count("1")
+            dead -= attacked[col] == full  # The new amazon fills a dead column
+            for c, r in enumerate(node.state):
+                if c == col:
+                    continue
+                mask = attacks[abs(col - c)][row]
+                if r != -1:
+                    conflicts += mask >> r & 1
+                elif mask & ~attacked[c]:
+                    was_free = full & ~attacked[c]
+                    attacked[c] |= mask
+                    free -= bin(was_free & mask).count("1")
+                    dead += was_free & ~mask == 0
+            node.conflicts, node.dead, node.attacked, node.free = conflicts, dead, attacked, free
 
-        return num_conflicts
+        unfilled = node.state.count(-1)
+        return N * N * ((N + 1) * (node.conflicts + node.dead) + unfilled) + node.free
+
+    def leader_possible(self, state):
+        """Can state still be completed into a solution smaller than (or
+        equal to) each of its images under SYMMETRIES? The state and an image
+        are only compared up to their first column unknown in either, so a
+        False is final, whatever the order the columns are filled in."""
+        N = self.N
+        placed = [(col, row) for col, row in enumerate(state) if row != -1]
+        for symmetry in SYMMETRIES:
+            image = [-1] * N
+            for col, row in placed:
+                image_col, image_row = symmetry(N, col, row)
+                image[image_col] = image_row
+            for row, image_row in zip(state, image):
+                if row == -1 or image_row == -1 or row < image_row:
+                    break  # Undecided yet, or smaller than this image
+                if row > image_row:
+                    return False
+        return True
+
+    def attacked_rows(self, state, col):
+        """Bitboard of the rows of column col attacked by the amazons of the
+        columns before it."""
+        attacks = self.attacks
+        mask = 0
+        for c in range(col):
+            mask |= attacks[col - c][state[c]]
+        return mask
 
     def conflicted(self, state, row, col):
-        return any(self.conflict(row, col, state[c], c)
-                   for c in range(col))
+        return self.attacked_rows(state, col) >> row & 1 == 1
 
     def conflict(self, row1, col1, row2, col2):
         return (row1 == row2 or
@@ -63,34 +187,191 @@ class NAmazonsProblem(Problem):
                 (row1 + 1 == row2 and col1 - 4 == col2) or
                 (row1 - 1 == row2 and col1 - 4 == col2))
 
+#######################
+# Backtracking engine #
+#######################
+
+def forward_checking_solutions(problem):
+    """Depth-first backtracking with forward checking. Every unfilled column
+    keeps the bitboard of its rows not attacked yet; the column with the
+    fewest of them is filled first (fail-first), and a placement is undone
+    as soon as it empties the domain of another column. Domains are updated
+    in place and restored from a trail, so memory is bounded by the depth
+    of the current branch (at most N^2 trail entries and N nodes) instead of
+    growing with a frontier. The symmetry breaking of the problem applies:
+    the first column starts with the upper half of the rows, and with
+    "leader", placements that cannot lead to a leader solution are cut.
+    Yield the goal Node of every solution, its path() going through one
+    state per amazon placed."""
+    N = problem.N
+    attacks = problem.attacks
+    domains = [problem.full] * N
+    if problem.symmetry_breaking:
+        domains[0] = problem.upper_half
+    unfilled = set(range(N))
+    trail = []  # (column, previous domain) of every domain change
+
+    def backtrack(node):
+        if not unfilled:
+            yield node
+            return
+
+        col = min(unfilled, key=lambda c: bin(domains[c]).count("1"))
+        unfilled.remove(col)
+        rows = domains[col]
+        while rows:
+            bit = rows & -rows
+            rows ^= bit
+            row = bit.bit_length() - 1
+
+            mark = len(trail)
+            wipeout = False
+            for c in unfilled:
+                pruned = domains[c] & ~attacks[abs(c - col)][row]
+                if pruned != domains[c]:
+                    trail.append((c, domains[c]))
+                    domains[c] = pruned
+                    if not pruned:
+                        wipeout = True
+                        break
+
+            if not wipeout:
+                state = list(node.state)
+                state[col] = row
+                state = tuple(state)
+                if problem.symmetry_breaking != "leader" or problem.leader_possible(state):
+                    yield from backtrack(Node(state, node, (col, row), node.path_cost + 1))
+
+            while len(trail) > mark:
+                c, domain = trail.pop()
+                domains[c] = domain
+        unfilled.add(col)
+
+    return backtrack(Node(problem.initial))
+
+
+def forward_checking_search(problem):
+    """Return the goal Node of the first solution found by
+    forward_checking_solutions(), or None if there is no solution."""
+    return next(forward_checking_solutions(problem), None)
+
+
+######################
+# Min-conflicts mode #
+######################
+
+def min_conflicts_search(problem, max_steps=None, restarts=20, candidates=32):
+    """Min-conflicts repair, for boards far too large for exhaustive search.
+    Columns are first filled greedily, each with the least attacked of
+    candidates random rows; then a random attacked amazon is moved to the
+    least attacked row of its column, ties broken at random, until no
+    amazon is attacked. After max_steps moves (10 N by default) without a
+    solution, the search restarts from a new greedy placement, up to
+    restarts times. Attacks are counted in O(1): occupancy counters per row
+    and diagonal, and the rows of the amazons at the knight-like offsets.
+    Return a Node holding the full state, or None."""
+    N = problem.N
+    if max_steps is None:
+        max_steps = 10 * N
+
+    for _ in range(restarts + 1):
+        placement = [None] * N
+        row_count = [0] * N
+        diagonal_count = [0] * (2 * N - 1)  # Indexed by row - col + N - 1
+        anti_diagonal_count = [0] * (2 * N - 1)  # Indexed by row + col
+
+        def move(col, row, step):
+            """Add (step = 1) or remove (step = -1) the amazon at (row, col)."""
+            placement[col] = row if step > 0 else None
+            row_count[row] += step
+            diagonal_count[row - col + N - 1] += step
+            anti_diagonal_count[row + col] += step
+
+        def attackers(row, col):
+            """Number of amazons of the other columns attacking (row, col)."""
+            count = row_count[row] + diagonal_count[row - col + N - 1] + anti_diagonal_count[row + col]
+            for d, k in KNIGHT_OFFSETS:
+                for other in (col - d, col + d):
+                    if 0 <= other < N and placement[other] is not None and abs(placement[other] - row) == k:
+                        count += 1
+            return count
+
+        def least_attacked(col, rows):
+            best, chosen = None, []
+            for row in rows:
+                count = attackers(row, col)
+                if best is None or count < best:
+                    best, chosen = count, [row]
+                elif count == best:
+                    chosen.append(row)
+            return random.choice(chosen)
+
+        for col in range(N):
+            rows = random.sample(range(N), min(candidates, N))
+            move(col, least_attacked(col, rows), 1)
+
+        for _ in range(max_steps):
+            attacked = [col for col in range(N) if attackers(placement[col], col) > 3]
+            if not attacked:
+                break
+            col = random.choice(attacked)
+            move(col, placement[col], -1)
+            move(col, least_attacked(col, range(N)), 1)
+
+        state = tuple(placement)
+        if problem.goal_test(state):
+            return Node(state)
+    return None
+
+
+SEARCHES = {
+    "astar": astar_search,
+    "backtracking": forward_checking_search,
+    "minconflicts": min_conflicts_search,
+}
+
 #####################
 # Launch the search #
 #####################
 
-problem = NAmazonsProblem(int(sys.argv[1]))
+parser = argparse.ArgumentParser(description="Place N amazons on an NxN board with none attacking each other.")
+parser.add_argument("N", type=int, help="size of the board")
+parser.add_argument("search", nargs="?", choices=list(SEARCHES), default="astar",
+                    help="search engine (default: astar)")
+parser.add_argument("--symmetry", choices=["half", "leader"],
+                    help="symmetry breaking: half restricts the first column to the upper half of the rows, "
+                         "leader also cuts the non-leader symmetric solutions (exhaustive searches)")
+args = parser.parse_args()
+
+problem = NAmazonsProblem(args.N, args.symmetry)
+search = SEARCHES[args.search]
 
 start_timer = time.perf_counter()
 
-node = astar_search(problem) # TODO: Launch the search
+node = search(problem) # TODO: Launch the search
 
 end_timer = time.perf_counter()
 
 
 # example of print
-path = node.path()
-
-print('Number of moves: ', str(node.depth))
-
-for n in path:
-    state = n.state
-    for row in range(len(state)):
-        row_str = ''
-        for col in range(len(state)):
-            if state[col] == row:
-                row_str += 'A'
-            else:
-                row_str += '#'
-        print(row_str)
-    print()
+if node is None:
+    # No placement exists for this N, or min-conflicts ran out of restarts
+    print('No solution found')
+else:
+    path = node.path()
+
+    print('Number of moves: ', str(node.depth))
+
+    for n in path:
+        state = n.state
+        for row in range(len(state)):
+            row_str = ''
+            for col in range(len(state)):
+                if state[col] == row:
+                    row_str += 'A'
+                else:
+                    row_str += '#'
+            print(row_str)
+        print()
 
 #print("Time: ", end_timer - start_timer)
@@ -1,7 +1,16 @@
 import random
 import time
 import math
-import sys
+import argparse
+import csv
+import functools
+import gzip
+import json
+import mmap
+import multiprocessing
+import os
+
+import numpy as np
 
 
 def count_conflicts(board):
@@ -44,6 +53,202 @@ def objective_score(board):
     return conflicts + empty_tiles
 
 
+@functools.lru_cache(maxsize=None)
+def board_geometry(size):
+    """Unit lookups of each cell index of a size x size board: its row, its
+    column, its box and its peers (the cells sharing a unit with it, itself
+    included). Computed once per size."""
+    subgrid_size = int(math.sqrt(size))
+    cells = range(size * size)
+    row_of = [i // size for i in cells]
+    col_of = [i % size for i in cells]
+    box_of = [(row_of[i] // subgrid_size) * subgrid_size + col_of[i] // subgrid_size for i in cells]
+    peers = [tuple(p for p in cells
+                   if row_of[p] == row_of[i] or col_of[p] == col_of[i] or box_of[p] == box_of[i])
+             for i in cells]
+    return row_of, col_of, box_of, peers
+
+
+class SudokuBoard:
+    """Mutable Sudoku board stored as a flat bytearray, cell (row, col) being
+    at index row * size + col. Beside the cells, it keeps per-row, per-column
+    and per-box digit counts and occupancy bitmasks (bit d set when digit d is
+    present), the list of empty cells and a dead-end index (which empty cells
+    still have a legal digit), so that the score change of a move, the legal
+    digits of a cell and the dead-end test never need a scan of the board.
+
+    A move is a tuple of changes (index, old, new): apply() writes it in place
+    and returns the score change, undo() reverts it. A rejected move therefore
+    costs no copy of the board."""
+
+    def __init__(self, board):
+        size = len(board)
+        self.size = size
+        self.subgrid_size = int(math.sqrt(size))
+        self.stride = size + 1
+        self.cells = bytearray(size * size)
+        self.row_of, self.col_of, self.box_of, self.peers = board_geometry(size)
+
+        self.row_counts = [0] * (size * self.stride)
+        self.col_counts = [0] * (size * self.stride)
+        self.box_counts = [0] * (size * self.stride)
+        self.row_masks = [0] * size
+        self.col_masks = [0] * size
+        self.box_masks = [0] * size
+        self.full_mask = ((1 << self.stride) - 1) & ~1
+
+        self.empty = []  # Indexes of the empty cells, in no particular order
+        self.empty_slot = [-1] * (size * size)  # Position of each empty cell in self.empty
+
+        # Dead-end index: empty cells that still have a legal digit
+        self.live = [False] * (size * size)
+        self.live_count = 0
+        self.units_changed = False  # Set when a move changes an occupancy mask
+
+        self.score = 0
+        for i, digit in enumerate(digit for row in board for digit in row):
+            self.score += self._put(i, digit)
+        for i in self.empty:
+            self.live[i] = self.candidates(i) != 0
+            self.live_count += self.live[i]
+        self.units_changed = False
+
+    def _put(self, i, digit):
+        """Write digit in the cell i, whose previous digit has been taken
+        out, and return the score change."""
+        self.cells[i] = digit
+        if digit == 0:
+            self.empty_slot[i] = len(self.empty)
+            self.empty.append(i)
+            return 1  # One more empty tile
+
+        delta = 0
+        bit = 1 << digit
+
+        unit = self.row_of[i]
+        k = unit * self.stride + digit
+        if self.row_counts[k]:
+            delta += 1
+        else:
+            self.row_masks[unit] |= bit
+            self.units_changed = True
+        self.row_counts[k] += 1
+
+        unit = self.col_of[i]
+        k = unit * self.stride + digit
+        if self.col_counts[k]:
+            delta += 1
+        else:
+            self.col_masks[unit] |= bit
+            self.units_changed = True
+        self.col_counts[k] += 1
+
+        unit = self.box_of[i]
+        k = unit * self.stride + digit
+        if self.box_counts[k]:
+            delta += 1
+        else:
+            self.box_masks[unit] |= bit
+            self.units_changed = True
+        self.box_counts[k] += 1
+
+        return delta
+
+    def _take(self, i):
+        """Take the digit of the cell i out of the tables and return the
+        score change."""
+        digit = self.cells[i]
+        if digit == 0:
+            slot = self.empty_slot[i]
+            last = self.empty.pop()
+            if last != i:
+                self.empty[slot] = last
+                self.empty_slot[last] = slot
+            self.empty_slot[i] = -1
+            return -1  # One less empty tile
+
+        delta = 0
+        bit = 1 << digit
+
+        unit = self.row_of[i]
+        k = unit * self.stride + digit
+        self.row_counts[k] -= 1
+        if self.row_counts[k]:
+            delta -= 1
+        else:
+            self.row_masks[unit] &= ~bit
+            self.units_changed = True
+
+        unit = self.col_of[i]
+        k = unit * self.stride + digit
+        self.col_counts[k] -= 1
+        if self.col_counts[k]:
+            delta -= 1
+        else:
+            self.col_masks[unit] &= ~bit
+            self.units_changed = True
+
+        unit = self.box_of[i]
+        k = unit * self.stride + digit
+        self.box_counts[k] -= 1
+        if self.box_counts[k]:
+            delta -= 1
+        else:
+            self.box_masks[unit] &= ~bit
+            self.units_changed = True
+
+        return delta
+
+    def apply(self, move):
+        """Play the move on the board and return the score change."""
+        delta = 0
+        for i, _, new in move:
+            delta += self._take(i) + self._put(i, new)
+            self._refresh(i)
+        self.score += delta
+        return delta
+
+    def undo(self, move):
+        """Revert a move previously played with apply()."""
+        for i, old, _ in reversed(move):
+            self.score += self._take(i) + self._put(i, old)
+            self._refresh(i)
+
+    def _refresh(self, i):
+        """Update the dead-end index after the cell i changed. Only the cell
+        itself is checked, unless an occupancy mask changed, in which case its
+        row, column and box are."""
+        if not self.empty and not self.live_count:
+            return  # Full board, nothing is live
+
+        cells = self.cells
+        live = self.live
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        row_masks, col_masks, box_masks = self.row_masks, self.col_masks, self.box_masks
+        full_mask = self.full_mask
+        for p in self.peers[i] if self.units_changed else (i,):
+            flag = cells[p] == 0 and (
+                full_mask & ~(row_masks[row_of[p]] | col_masks[col_of[p]] | box_masks[box_of[p]])) != 0
+            if flag != live[p]:
+                live[p] = flag
+                self.live_count += 1 if flag else -1
+        self.units_changed = False
+
+    def dead_end(self):
+        """Is there no empty cell left that can be filled without conflict?"""
+        return self.live_count == 0
+
+    def candidates(self, i):
+        """Bitmask of the digits that can be put in the empty cell i without
+        conflict."""
+        used = self.row_masks[self.row_of[i]] | self.col_masks[self.col_of[i]] | self.box_masks[self.box_of[i]]
+        return self.full_mask & ~used
+
+    def to_lists(self):
+        size = self.size
+        return [list(self.cells[row * size:(row + 1) * size]) for row in range(size)]
+
+
 def has_conflicts(board, row, col):
     digit = board[row][col]
 
@@ -65,136 +270,1240 @@ def has_conflicts(board, row, col):
 
 
 def no_more_place_without_conflicts(board, initial_empty_positions):
-    neighbor = [row[:] for row in board]
-    size = len(board)
-    
-    empty_positions = [(i, j) for i in range(size) for j in range(size) if board[i][j] == 0]
-    
-    for position in empty_positions:
-        neighbor = generate_neighbor(neighbor, initial_empty_positions, position, False)
-    
-        if neighbor != board:
-            return False
-    
-    return True
+    if not isinstance(board, SudokuBoard):
+        board = SudokuBoard(board)
 
+    return board.dead_end()
 
-def generate_neighbor(board, initial_empty_positions, position=None, verif=True):
-    neighbor = [row[:] for row in board]
-    size = len(board)
 
+def random_digit(mask):
+    """Pick a random digit among the bits set in mask."""
+    for _ in range(random.randrange(mask.bit_count())):
+        mask &= mask - 1  # Drop the lowest set bit
+    return (mask & -mask).bit_length() - 1
+
+
+def generate_move(board, initial_empty_positions, position=None, verif=True):
+    """Return the move (a tuple of (index, old, new) changes) that turns the
+    SudokuBoard into a random neighbor, or an empty tuple if no neighbor could
+    be found. Positions are flat cell indexes. The board is left as it was."""
     if position is None:
-        empty_positions = [(i, j) for i in range(size) for j in range(size) if board[i][j] == 0]
-        try:
-            row, col = random.choice(empty_positions)
-        except IndexError:
-            return board
-    else:
-        row, col = position
+        if not board.empty:
+            return ()
+        position = random.choice(board.empty)
 
-    """ # Verif if the try except is correct then delete this part
-    if not empty_positions:
-        return board
-    """
-    
-    previous_digit = 0
-    
     if verif and no_more_place_without_conflicts(board, initial_empty_positions):
         # TODO: Implement a backtracking mechanism to deleta a random neighbor and try to find a new one
         position_to_delete = random.choice(initial_empty_positions)
-        previous_digit = neighbor[position_to_delete[0]][position_to_delete[1]]
-        neighbor[position_to_delete[0]][position_to_delete[1]] = 0
-    
-    digits = list(range(1, 10))
-    random.shuffle(digits)
+        previous_digit = board.cells[position_to_delete]
+        move = ((position_to_delete, previous_digit, 0),)
 
-    for digit in digits:
-        if previous_digit == digit:
-            continue
-        neighbor[row][col] = digit
+        # Clearing a tile can only free its own digit, which is excluded anyway
+        legal = board.candidates(position) & ~(1 << previous_digit)
+    else:
+        move = ()
+        legal = board.candidates(position)
 
-        if not has_conflicts(neighbor, row, col):
-            return neighbor
+    if legal:
+        return move + ((position, 0, random_digit(legal)),)
 
     # TODO: There a problem, if we removed the digit, we will probably have the same digit in the next iteration
     # So we need to add a condition to check if we can't find a new digit, we need to remove another digit until we find a new one
 
-    return board
+    return ()
+
+
+def generate_neighbor(board, initial_empty_positions, position=None, verif=True):
+    state = SudokuBoard(board)
+    size = state.size
+    if position is not None:
+        position = position[0] * size + position[1]
+
+    move = generate_move(state, [i * size + j for i, j in initial_empty_positions], position, verif)
+    if not move:
+        return board
+
+    state.apply(move)
+    return state.to_lists()
+
+
+@functools.lru_cache(maxsize=None)
+def board_units(size):
+    """Cell indexes of every row, column and box of a size x size board."""
+    row_of, col_of, box_of, _ = board_geometry(size)
+    rows = [[i for i in range(size * size) if row_of[i] == unit] for unit in range(size)]
+    cols = [[i for i in range(size * size) if col_of[i] == unit] for unit in range(size)]
+    boxes = [[i for i in range(size * size) if box_of[i] == unit] for unit in range(size)]
+    return rows, cols, boxes
+
+
+def presolve(board):
+    """Constraint propagation before the search: place naked singles and
+    hidden singles and eliminate locked candidates (pointing and claiming)
+    until nothing changes. Return the board with the forced cells filled, or
+    None if the givens are inconsistent (a digit repeated in a unit, a cell or
+    a digit of a unit left without any place)."""
+    size = len(board)
+    row_of, col_of, box_of, peers = board_geometry(size)
+    rows, cols, boxes = board_units(size)
+    units = rows + cols + boxes
+    cells = [digit for row in board for digit in row]
+    full_mask = ((1 << (size + 1)) - 1) & ~1
+
+    for unit in units:
+        digits = [cells[i] for i in unit if cells[i]]
+        if len(digits) != len(set(digits)):
+            return None
+
+    candidates = [0] * (size * size)
+    for i in range(size * size):
+        if cells[i] == 0:
+            candidates[i] = full_mask
+            for p in peers[i]:
+                candidates[i] &= ~(1 << cells[p])
+
+    def place(i, digit):
+        cells[i] = digit
+        candidates[i] = 0
+        for p in peers[i]:
+            candidates[p] &= ~(1 << digit)
+
+    def eliminate(targets, bit):
+        removed = False
+        for p in targets:
+            if candidates[p] & bit:
+                candidates[p] &= ~bit
+                removed = True
+        return removed
+
+    changed = True
+    while changed:
+        changed = False
+
+        # Naked singles: a cell with a single candidate
+        for i in range(size * size):
+            if cells[i] == 0:
+                mask = candidates[i]
+                if mask == 0:
+                    return None
+                if mask & (mask - 1) == 0:
+                    place(i, mask.bit_length() - 1)
+                    changed = True
+
+        # Hidden singles: a digit with a single place in a unit
+        for unit in units:
+            for digit in range(1, size + 1):
+                bit = 1 << digit
+                spots = [i for i in unit if candidates[i] & bit]
+                if not spots:
+                    if all(cells[i] != digit for i in unit):
+                        return None
+                elif len(spots) == 1:
+                    place(spots[0], digit)
+                    changed = True
+
+        # Locked candidates: the places of a digit in a box all lie on one
+        # line (pointing) or the places of a digit on a line all lie in one
+        # box (claiming), so the rest of that line or box cannot hold it
+        for unit_lists, line_of, lines in ((boxes, row_of, rows), (boxes, col_of, cols),
+                                           (rows, box_of, boxes), (cols, box_of, boxes)):
+            for unit in unit_lists:
+                for digit in range(1, size + 1):
+                    bit = 1 << digit
+                    spots = [i for i in unit if candidates[i] & bit]
+                    if spots and len({line_of[i] for i in spots}) == 1:
+                        inside = set(unit)
+                        others = [p for p in lines[line_of[spots[0]]] if p not in inside]
+                        if eliminate(others, bit):
+                            changed = True
+
+    return [cells[row * size:(row + 1) * size] for row in range(size)]
+
+
+def sudoku_engine(solver):
+    """Decorator of the Sudoku engines, which all share one prologue: the
+    wrapped engine is called as solver(puzzle, ..., stats=stats) with the
+    presolved puzzle (or a copy of the givens if propagate is False, to
+    leave all the work to the search) and a stats dict (the caller's one,
+    if given) whose "iterations" entry is reset to 0, for the engine to
+    count its work in. If the givens are inconsistent, the engine is not
+    called and the puzzle is returned with its score."""
+
+    @functools.wraps(solver)
+    def run(initial_board, *args, stats=None, propagate=True, **options):
+        if stats is None:
+            stats = {}
+        stats["iterations"] = 0
+
+        if propagate:
+            # Cells forced by the givens become pseudo-givens
+            puzzle = presolve(initial_board)
+        else:
+            puzzle = None if count_conflicts(initial_board) else [row[:] for row in initial_board]
+        if puzzle is None:
+            return [row[:] for row in initial_board], objective_score(initial_board)
+        return solver(puzzle, *args, stats=stats, **options)
+
+    return run
+
+
+def deadline_time(deadline):
+    """Timer value (time.perf_counter()) at which a search given deadline
+    seconds must stop, or None if deadline is None."""
+    return None if deadline is None else time.perf_counter() + deadline
 
 
 def initial_position_empty(board):
     return [(i, j) for i in range(len(board)) for j in range(len(board)) if board[i][j] == 0]
 
 
-def simulated_annealing_solver(initial_board):
+def fill_boxes(board, initial_empty_positions):
+    """Fill the empty cells of every box of the SudokuBoard with the digits
+    missing from that box, in random order, so that the box constraints hold.
+    Return the move that was played."""
+    by_box = {}
+    for i in initial_empty_positions:
+        if board.cells[i] == 0:
+            by_box.setdefault(board.box_of[i], []).append(i)
+
+    move = []
+    for box, cells in by_box.items():
+        missing = [digit for digit in range(1, board.size + 1) if not board.box_masks[box] >> digit & 1]
+        random.shuffle(missing)
+        # With duplicated givens a box has more empty cells than missing digits
+        while len(missing) < len(cells):
+            missing.append(random.randint(1, board.size))
+        move.extend((i, 0, digit) for i, digit in zip(cells, missing))
+
+    move = tuple(move)
+    board.apply(move)
+    return move
+
+
+def generate_swap_move(board, free_cells_by_box):
+    """Return the move that swaps the digits of two non-given cells of a same
+    box, or an empty tuple if the two cells hold the same digit."""
+    cells = random.choice(free_cells_by_box)
+    a, b = random.sample(cells, 2)
+    digit_a, digit_b = board.cells[a], board.cells[b]
+    if digit_a == digit_b:
+        return ()
+    return (a, digit_a, digit_b), (b, digit_b, digit_a)
+
+
+def fill_strategy(board, initial_empty_positions):
+    """Original neighborhood: put a legal digit in one empty tile, clearing a
+    tile first when no empty tile can be filled anymore."""
+    return lambda: generate_move(board, initial_empty_positions)
+
+
+def swap_strategy(board, initial_empty_positions):
+    """Box-permutation neighborhood: every box is first filled with its
+    missing digits, then moves swap two non-given cells of a same box. Boxes
+    stay valid, so only row and column conflicts change the score."""
+    fill_boxes(board, initial_empty_positions)
+
+    by_box = {}
+    for i in initial_empty_positions:
+        by_box.setdefault(board.box_of[i], []).append(i)
+    free_cells_by_box = [cells for cells in by_box.values() if len(cells) > 1]
+    if not free_cells_by_box:
+        return lambda: ()
+
+    return lambda: generate_swap_move(board, free_cells_by_box)
+
+
+STRATEGIES = {
+    "fill": fill_strategy,
+    "swap": swap_strategy,
+}
+
+
+class GeometricSchedule:
+    """Fixed geometric cooling: the temperature is multiplied by cooling_rate
+    at every iteration until it reaches t_min."""
+
+    samples = 0  # No calibration
+
+    def __init__(self, temperature=1.0, cooling_rate=0.9999, t_min=0.0001):
+        self.temperature = temperature
+        self.cooling_rate = cooling_rate
+        self.t_min = t_min
+
+    def calibrate(self, deltas):
+        pass
+
+    def done(self):
+        return self.temperature <= self.t_min
+
+    def update(self, accepted, score):
+        self.temperature *= self.cooling_rate
+
+
+class AdaptiveSchedule:
+    """Cooling schedule that adapts to the search:
+    - the initial temperature is calibrated from sampled score changes, so
+      that an average uphill move is accepted with initial_acceptance;
+    - every window iterations, the cooling goes twice as fast when more than
+      target_acceptance of the moves were accepted, and half as fast when
+      less than half of that were;
+    - when the best score has not improved for reheat_window iterations, or
+      the temperature reaches t_min, the temperature goes back up to
+      reheat_ratio of the initial one, at most max_reheats times."""
+
+    samples = 200  # Moves sampled to calibrate the initial temperature
+
+    def __init__(self, initial_acceptance=0.5, target_acceptance=0.2, cooling_rate=0.9999, t_min=0.0001,
+                 window=500, reheat_window=20000, reheat_ratio=0.5, max_reheats=5):
+        self.initial_acceptance = initial_acceptance
+        self.target_acceptance = target_acceptance
+        self.cooling_rate = cooling_rate
+        self.t_min = t_min
+        self.window = window
+        self.reheat_window = reheat_window
+        self.reheat_ratio = reheat_ratio
+        self.max_reheats = max_reheats
+
+        self.temperature = self.initial = 1.0
+        self.iteration = 0
+        self.accepted = 0
+        self.best_score = None
+        self.best_iteration = 0
+        self.reheats = 0
+
+    def calibrate(self, deltas):
+        uphill = [delta for delta in deltas if delta > 0]
+        if uphill:
+            self.temperature = self.initial = -(sum(uphill) / len(uphill)) / math.log(self.initial_acceptance)
+
+    def done(self):
+        return self.temperature <= self.t_min and self.reheats >= self.max_reheats
+
+    def update(self, accepted, score):
+        self.iteration += 1
+        self.accepted += accepted
+        if self.best_score is None or score < self.best_score:
+            self.best_score = score
+            self.best_iteration = self.iteration
+
+        if self.iteration % self.window == 0:
+            factor = self.cooling_rate ** self.window
+            acceptance = self.accepted / self.window
+            if acceptance > self.target_acceptance:
+                factor *= factor
+            elif acceptance < self.target_acceptance / 2:
+                factor = math.sqrt(factor)
+            self.temperature *= factor
+            self.accepted = 0
+
+        stagnating = self.iteration - self.best_iteration >= self.reheat_window
+        if (stagnating or self.temperature <= self.t_min) and self.reheats < self.max_reheats:
+            self.temperature = max(self.temperature, self.initial * self.reheat_ratio)
+            self.best_iteration = self.iteration
+            self.reheats += 1
+
+
+SCHEDULES = {
+    "geometric": GeometricSchedule,
+    "adaptive": AdaptiveSchedule,
+}
+
+
+@sudoku_engine
+def simulated_annealing_solver(puzzle, strategy="fill", fallback=None, stall_iterations=5000,
+                               stall_score=4, schedule=None, deadline=None, max_iterations=None,
+                               progress=None, progress_every=1000, completion_score=4, completion_every=500,
+                               completion_nodes=10000, stats=None, trace=None):
     """
-    Simulated annealing Sudoku solver.
+    Simulated annealing Sudoku solver. The strategy is the name of the
+    neighborhood to use, one of STRATEGIES. The schedule drives the
+    temperature, a GeometricSchedule from 1.0 to 0.0001 by default.
+
+    If a fallback solver is given (e.g. dlx_solver), the search is handed off
+    to it on the presolved puzzle when the annealer stalls: the best score is
+    at most stall_score and has not improved for stall_iterations
+    iterations, or the schedule ends without reaching 0.
+
+    The search is anytime: it stops with the best board found so far after
+    deadline seconds or max_iterations iterations, if given. progress, if
+    given, is called as progress(iteration, temperature, current_score,
+    best_score) every progress_every iterations.
+
+    Near the goal, the annealer tries to finish exactly: whenever an accepted
+    move reaches a score of at most completion_score (0 disables it), and at
+    most once every completion_every iterations, exact_completion() frees the
+    cells of the remaining conflicts and their peers and solves them with a
+    budget of completion_nodes search nodes. A board it could not finish is
+    not tried again.
+
+    If trace is a SolverTrace, every iteration is reported to it.
     """
-    current_solution = [row[:] for row in initial_board]
-    best_solution = current_solution
-    
-    initial_empty_positions = initial_position_empty(initial_board)
+    end_time = deadline_time(deadline)
 
-    current_score = objective_score(current_solution)
+    # Moves are played in place on a single board and undone when rejected
+    current_solution = SudokuBoard(puzzle)
+
+    size = current_solution.size
+    initial_empty_positions = [i * size + j for i, j in initial_position_empty(puzzle)]
+    # Given tiles are never part of a move
+    next_move = STRATEGIES[strategy](current_solution, initial_empty_positions)
+
+    best_solution = current_solution.to_lists()
+    current_score = current_solution.score
     best_score = current_score
+    if current_score == 0:
+        return best_solution, best_score
 
-    temperature = 1.0
-    cooling_rate = 0.9999  # Adjust this parameter to control the cooling rate
+    if schedule is None:
+        schedule = GeometricSchedule()
+    if schedule.samples:
+        deltas = []
+        for _ in range(schedule.samples):
+            move = next_move()
+            deltas.append(current_solution.apply(move))
+            current_solution.undo(move)
+        schedule.calibrate(deltas)
+    iteration = last_improvement = 0
+    last_completion = -completion_every
+    failed_completion = None  # Cells of the last board exact_completion() could not finish
 
-    while temperature > 0.0001:
+    while not schedule.done():
+        temperature = schedule.temperature
         try:
-            # TODO: Generate a neighbor (Don't forget to skip non-zeros tiles in the initial board ! It will be verified on Inginious.)
-            neighbor = generate_neighbor(current_solution, initial_empty_positions)
+            if max_iterations is not None and iteration >= max_iterations:
+                break
+            if end_time is not None and iteration & 63 == 0 and time.perf_counter() >= end_time:
+                return best_solution, best_score  # Out of time, no fallback either
+            if fallback is not None and best_score <= stall_score \
+                    and iteration - last_improvement >= stall_iterations:
+                break  # Stalled near the goal, let the fallback finish
+
+            # Only the iterations that run are counted
+            iteration += 1
+            stats["iterations"] = iteration
+            if progress is not None and iteration % progress_every == 0:
+                progress(iteration, temperature, current_score, best_score)
+
+            move = next_move()
 
             # Evaluate the neighbor
-            neighbor_score = objective_score(neighbor)
+            neighbor_score = current_score + current_solution.apply(move)
 
             # Calculate acceptance probability
             delta = float(current_score - neighbor_score)
 
             # Accept the neighbor with a probability based on the acceptance probability
-            if neighbor_score < current_score or (
-                    neighbor_score > 0 and math.exp((delta / temperature)) > random.random()):
-                current_solution = neighbor
+            accepted = neighbor_score < current_score or (
+                    neighbor_score > 0 and math.exp((delta / temperature)) > random.random())
+            if trace is not None:
+                traced_score = neighbor_score if accepted else current_score
+                trace.step(iteration, temperature, accepted, traced_score, min(best_score, traced_score))
+            if accepted:
                 current_score = neighbor_score
 
                 if current_score == 0:
-                    return current_solution, current_score
+                    return current_solution.to_lists(), current_score
+
+                if current_score <= completion_score and iteration - last_completion >= completion_every \
+                        and current_solution.cells != failed_completion:
+                    last_completion = iteration
+                    completed = exact_completion(current_solution.to_lists(), puzzle, completion_nodes)
+                    if completed is not None:
+                        return completed, 0
+                    failed_completion = bytes(current_solution.cells)
 
                 if current_score < best_score:
-                    best_solution = current_solution
+                    best_solution = current_solution.to_lists()
                     best_score = current_score
+                    last_improvement = iteration
+            else:
+                current_solution.undo(move)
 
             # Cool down the temperature
-            temperature *= cooling_rate
+            schedule.update(accepted, current_score)
         except KeyboardInterrupt:
             print("Break asked")
             break
 
+    if fallback is not None and best_score > 0:
+        exact_solution, exact_score = fallback(puzzle)
+        if exact_score < best_score:
+            return exact_solution, exact_score
+
     return best_solution, best_score
- 
+
+
+class SolverTrace:
+    """Opt-in instrumentation of the annealer. While the trace is active
+    (with trace: ...), the hot functions of this module are wrapped to count
+    their calls and the time spent in them (nested calls included); outside
+    of it nothing is wrapped, so a disabled trace costs nothing. Passed to
+    simulated_annealing_solver, it also records the acceptance rate per
+    temperature band (bands_per_decade bands per power of ten) and the
+    trajectory of the temperature and of the scores, sampled every
+    sample_every iterations and at every new best score."""
+
+    FUNCTIONS = ("generate_neighbor", "generate_move", "has_conflicts", "objective_score",
+                 "no_more_place_without_conflicts")
+    METHODS = ("apply", "undo", "candidates")  # SudokuBoard, where moves are scored
+
+    def __init__(self, bands_per_decade=4, sample_every=100):
+        self.bands_per_decade = bands_per_decade
+        self.sample_every = sample_every
+        self.calls = {name: 0 for name in self.FUNCTIONS + self.METHODS}
+        self.time = {name: 0.0 for name in self.FUNCTIONS + self.METHODS}
+        self.bands = {}  # Band number -> [accepted moves, proposed moves]
+        self.trajectory = []  # (iteration, temperature, current score, best score)
+        self._best = None
+        self._saved = None
+
+    def _wrap(self, name, function):
+        calls, spent = self.calls, self.time
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                spent[name] += time.perf_counter() - start
+
+        return wrapper
+
+    def __enter__(self):
+        module = globals()
+        self._saved = ({name: module[name] for name in self.FUNCTIONS},
+                       {name: getattr(SudokuBoard, name) for name in self.METHODS})
+        for name in self.FUNCTIONS:
+            module[name] = self._wrap(name, module[name])
+        for name in self.METHODS:
+            setattr(SudokuBoard, name, self._wrap(name, getattr(SudokuBoard, name)))
+        return self
+
+    def __exit__(self, *exc):
+        functions, methods = self._saved
+        globals().update(functions)
+        for name, method in methods.items():
+            setattr(SudokuBoard, name, method)
+        self._saved = None
+
+    def step(self, iteration, temperature, accepted, current_score, best_score):
+        band = math.floor(math.log10(temperature) * self.bands_per_decade)
+        counts = self.bands.setdefault(band, [0, 0])
+        counts[0] += accepted
+        counts[1] += 1
+
+        if iteration % self.sample_every == 0 or self._best is None or best_score < self._best:
+            self._best = best_score
+            self.trajectory.append((iteration, temperature, current_score, best_score))
+
+    def report(self):
+        return {
+            "calls": self.calls,
+            "time": self.time,
+            "acceptance": [{"t_low": 10 ** (band / self.bands_per_decade),
+                            "t_high": 10 ** ((band + 1) / self.bands_per_decade),
+                            "accepted": accepted, "proposed": proposed, "rate": accepted / proposed}
+                           for band, (accepted, proposed) in sorted(self.bands.items(), reverse=True)],
+            "trajectory": [{"iteration": iteration, "temperature": temperature,
+                            "current_score": current_score, "best_score": best_score}
+                           for iteration, temperature, current_score, best_score in self.trajectory],
+        }
+
+    def save(self, file_path):
+        """Write the trace as JSON, or as CSV if file_path ends with .csv
+        (one section per table: calls, acceptance, trajectory)."""
+        report = self.report()
+        with open(file_path, "w", newline="") as file:
+            if not file_path.endswith(".csv"):
+                json.dump(report, file, indent=2)
+                return
+
+            writer = csv.writer(file)
+            writer.writerow(["function", "calls", "time"])
+            for name in self.calls:
+                writer.writerow([name, self.calls[name], self.time[name]])
+            writer.writerow([])
+            writer.writerow(["t_low", "t_high", "accepted", "proposed", "rate"])
+            for band in report["acceptance"]:
+                writer.writerow([band["t_low"], band["t_high"], band["accepted"], band["proposed"], band["rate"]])
+            writer.writerow([])
+            writer.writerow(["iteration", "temperature", "current_score", "best_score"])
+            writer.writerows(self.trajectory)
+
+
+class DancingLinks:
+    """Exact cover with Knuth's Algorithm X and dancing links. The links are
+    kept in flat lists indexed by node: node 0 is the root, nodes 1 to
+    n_columns are the column headers and the following ones are the 1s of
+    the rows added with add_row()."""
+
+    def __init__(self, n_columns):
+        nodes = range(n_columns + 1)
+        self.left = [i - 1 for i in nodes]
+        self.right = [i + 1 for i in nodes]
+        self.left[0], self.right[n_columns] = n_columns, 0
+        self.up = list(nodes)
+        self.down = list(nodes)
+        self.column = list(nodes)
+        self.row_of_node = [None] * (n_columns + 1)
+        self.sizes = [0] * (n_columns + 1)
+        self.nodes = 0  # Search nodes visited by the last solve()
+
+    def add_row(self, row, columns):
+        """Add a row, identified by row, with a 1 in each of the columns
+        (numbered from 1)."""
+        first = len(self.column)
+        for k, col in enumerate(columns):
+            node = first + k
+            self.left.append(node - 1 if k else first + len(columns) - 1)
+            self.right.append(node + 1 if k < len(columns) - 1 else first)
+            self.up.append(self.up[col])
+            self.down.append(col)
+            self.down[self.up[col]] = node
+            self.up[col] = node
+            self.column.append(col)
+            self.row_of_node.append(row)
+            self.sizes[col] += 1
+
+    def _cover(self, col):
+        left, right, up, down, column, sizes = self.left, self.right, self.up, self.down, self.column, self.sizes
+        right[left[col]], left[right[col]] = right[col], left[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                down[up[j]], up[down[j]] = down[j], up[j]
+                sizes[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, col):
+        left, right, up, down, column, sizes = self.left, self.right, self.up, self.down, self.column, self.sizes
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                sizes[column[j]] += 1
+                down[up[j]] = up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[col]] = left[right[col]] = col
+
+    def solve(self, max_solutions=1, max_nodes=None):
+        """Return up to max_solutions exact covers, each one being the list of
+        the rows it selects. If max_nodes is given, the search gives up after
+        visiting that many nodes and returns the covers found so far."""
+        solutions = []
+        partial = []
+        right, down, column, sizes = self.right, self.down, self.column, self.sizes
+        self.nodes = 0
+
+        def search():
+            self.nodes += 1
+            if max_nodes is not None and self.nodes > max_nodes:
+                return True  # Out of budget, stop the whole search
+            if right[0] == 0:
+                solutions.append([self.row_of_node[node] for node in partial])
+                return len(solutions) >= max_solutions
+
+            # Column with the fewest remaining rows first
+            col, best = 0, None
+            c = right[0]
+            while c != 0:
+                if best is None or sizes[c] < best:
+                    col, best = c, sizes[c]
+                    if best <= 1:
+                        break
+                c = right[c]
+            if best == 0:
+                return False
+
+            self._cover(col)
+            done = False
+            i = down[col]
+            while i != col:
+                partial.append(i)
+                j = right[i]
+                while j != i:
+                    self._cover(column[j])
+                    j = right[j]
+
+                done = search()
+
+                j = self.left[i]
+                while j != i:
+                    self._uncover(column[j])
+                    j = self.left[j]
+                partial.pop()
+                if done:
+                    break
+                i = down[i]
+            self._uncover(col)
+            return done
+
+        search()
+        return solutions
+
+
+def sudoku_exact_cover(board):
+    """Build the exact cover problem of a Sudoku: one column per cell,
+    row-digit, column-digit and box-digit constraint, one row (cell, digit)
+    per given tile and per digit left possible in an empty tile."""
+    size = len(board)
+    row_of, col_of, box_of, peers = board_geometry(size)
+    cells = [digit for row in board for digit in row]
+    n_cells = size * size
+
+    dlx = DancingLinks(4 * n_cells)
+    for i in range(n_cells):
+        if cells[i]:
+            digits = [cells[i]]
+        else:
+            used = {cells[p] for p in peers[i]}
+            digits = [digit for digit in range(1, size + 1) if digit not in used]
+        for digit in digits:
+            dlx.add_row((i, digit), (1 + i,
+                                     1 + n_cells + row_of[i] * size + digit - 1,
+                                     1 + 2 * n_cells + col_of[i] * size + digit - 1,
+                                     1 + 3 * n_cells + box_of[i] * size + digit - 1))
+    return dlx
+
+
+@sudoku_engine
+def dlx_solver(puzzle, stats=None):
+    """
+    Exact Sudoku solver: Dancing Links on the presolved puzzle. Return the
+    solution and a score of 0, or the puzzle and its score if it has no
+    solution. The search nodes count as iterations.
+    """
+
+    dlx = sudoku_exact_cover(puzzle)
+    solutions = dlx.solve()
+    stats["iterations"] = dlx.nodes
+    if not solutions:
+        return puzzle, objective_score(puzzle)
+
+    size = len(puzzle)
+    solution = [row[:] for row in puzzle]
+    for i, digit in solutions[0]:
+        solution[i // size][i % size] = digit
+    return solution, 0
+
+
+def exact_completion(board, puzzle, max_nodes=10000):
+    """Finish a near-solution exactly: the empty tiles and the non-given
+    cells in conflict are freed along with their non-given peers, the other
+    cells are kept, and the freed cells are solved by Dancing Links within
+    max_nodes search nodes. Return the solution, or None if the kept cells
+    admit none or the budget runs out. puzzle holds the givens."""
+    size = len(board)
+    _, _, _, peers = board_geometry(size)
+    cells = [digit for row in board for digit in row]
+    givens = [digit for row in puzzle for digit in row]
+
+    freed = set()
+    for i, digit in enumerate(cells):
+        if not givens[i] and (digit == 0 or any(cells[p] == digit for p in peers[i] if p != i)):
+            freed.update(p for p in peers[i] if not givens[p])
+
+    partial = [0 if i in freed else digit for i, digit in enumerate(cells)]
+    dlx = sudoku_exact_cover([partial[row * size:(row + 1) * size] for row in range(size)])
+    solutions = dlx.solve(max_nodes=max_nodes)
+    if not solutions:
+        return None
+
+    for i, digit in solutions[0]:
+        partial[i] = digit
+    return [partial[row * size:(row + 1) * size] for row in range(size)]
+
+
+# Parallel tempering: replicas at different temperatures run in a pool of
+# processes and exchange their states between rounds.
+
+_tempering_puzzle = None
+_tempering_strategy = None
+_tempering_stop = None
+
+
+def _init_tempering_worker(initial_board, strategy, stop):
+    global _tempering_puzzle, _tempering_strategy, _tempering_stop
+    _tempering_puzzle = initial_board
+    _tempering_strategy = strategy
+    _tempering_stop = stop
+
+
+def _tempering_run(task):
+    """Run one replica for a number of Metropolis steps at a fixed
+    temperature. Return its final state and score, and the best state and
+    score it went through."""
+    state, temperature, steps, seed = task
+    random.seed(seed)
+
+    board = SudokuBoard(_tempering_puzzle)
+    size = board.size
+    initial_empty_positions = [i * size + j for i, j in initial_position_empty(_tempering_puzzle)]
+    if state is not None:
+        board.apply(tuple((i, board.cells[i], state[i]) for i in initial_empty_positions))
+    next_move = STRATEGIES[_tempering_strategy](board, initial_empty_positions)
+
+    score = board.score
+    best_state, best_score = bytes(board.cells), score
+
+    for step in range(steps):
+        if score == 0 or (step & 127 == 0 and _tempering_stop.is_set()):
+            break
+
+        move = next_move()
+        neighbor_score = score + board.apply(move)
+        if neighbor_score <= score or math.exp((score - neighbor_score) / temperature) > random.random():
+            score = neighbor_score
+            if score < best_score:
+                best_state, best_score = bytes(board.cells), score
+        else:
+            board.undo(move)
+
+    if best_score == 0:
+        _tempering_stop.set()  # The other replicas can stop, a solution is found
+
+    return bytes(board.cells), score, best_state, best_score
+
+
+@sudoku_engine
+def parallel_tempering_solver(puzzle, workers=None, replicas=8, strategy="swap",
+                              t_min=0.05, t_max=1.0, steps=2000, max_rounds=500, deadline=None, stats=None):
+    """
+    Parallel tempering Sudoku solver. The replicas run at temperatures spread
+    geometrically between t_max and t_min in a pool of workers processes
+    (one per CPU by default). After each round of steps, neighbouring
+    replicas exchange their states following the Metropolis swap rule. The
+    search stops as soon as one replica reaches a score of 0, or with the
+    best board found so far after the round that passes deadline seconds.
+    Iterations are counted in steps per replica.
+    """
+    end_time = deadline_time(deadline)
+    if objective_score(puzzle) == 0:
+        return puzzle, 0
+
+    replicas = max(replicas, 2)
+    temperatures = [t_max * (t_min / t_max) ** (k / (replicas - 1)) for k in range(replicas)]
+    states = [None] * replicas  # None starts a replica from the puzzle itself
+    scores = [None] * replicas
+
+    best_solution = puzzle
+    best_score = objective_score(best_solution)
+    size = len(puzzle)
+
+    stop = multiprocessing.Event()
+    with multiprocessing.Pool(workers, initializer=_init_tempering_worker,
+                              initargs=(puzzle, strategy, stop)) as pool:
+        for round_number in range(max_rounds):
+            try:
+                tasks = [(states[k], temperatures[k], steps, random.getrandbits(64)) for k in range(replicas)]
+                results = pool.map(_tempering_run, tasks)
+            except KeyboardInterrupt:
+                print("Break asked")
+                break
+            stats["iterations"] += steps
+
+            for k, (state, score, replica_best, replica_best_score) in enumerate(results):
+                states[k], scores[k] = state, score
+                if replica_best_score < best_score:
+                    best_score = replica_best_score
+                    best_solution = [list(replica_best[row * size:(row + 1) * size]) for row in range(size)]
+
+            if best_score == 0 or (end_time is not None and time.perf_counter() >= end_time):
+                break
+
+            # Metropolis swap between neighbouring temperatures, alternating
+            # the even and odd pairs from one round to the next
+            for k in range(round_number % 2, replicas - 1, 2):
+                exponent = (1 / temperatures[k] - 1 / temperatures[k + 1]) * (scores[k] - scores[k + 1])
+                if exponent >= 0 or math.exp(exponent) > random.random():
+                    states[k], states[k + 1] = states[k + 1], states[k]
+                    scores[k], scores[k + 1] = scores[k + 1], scores[k]
+
+    return best_solution, best_score
+
+
+@sudoku_engine
+def batched_annealing_solver(board, chains=64, cooling_rate=0.9999, seed=None, deadline=None,
+                             stats=None):
+    """
+    Vectorized simulated annealing: chains independent annealers with the
+    box-permutation swap neighborhood, held in a single (chains, size, size)
+    int8 array. Every step proposes one swap per chain and computes the score
+    changes, acceptance tests and updates for the whole batch with NumPy. The
+    search stops as soon as one chain reaches a score of 0, or with the best
+    board found so far after deadline seconds. Every batch step counts as
+    one iteration.
+    """
+    end_time = deadline_time(deadline)
+
+    rng = np.random.default_rng(seed)
+    size = len(board)
+    subgrid_size = int(math.sqrt(size))
+    row_of, col_of, box_of, _ = board_geometry(size)
+    row_of, col_of = np.array(row_of), np.array(col_of)
+
+    puzzle = np.array(board, dtype=np.int8).reshape(-1)
+    boards = np.repeat(puzzle[None], chains, axis=0)
+
+    # Fill every box of every chain with its missing digits, in random order
+    free_by_box = []
+    for box in range(size):
+        cells = [i for i in range(size * size) if box_of[i] == box]
+        free = [i for i in cells if puzzle[i] == 0]
+        if not free:
+            continue
+        missing = [digit for digit in range(1, size + 1) if digit not in puzzle[cells]]
+        missing += list(rng.integers(1, size + 1, max(len(free) - len(missing), 0)))  # Duplicated givens
+        boards[:, free] = rng.permuted(np.tile(np.array(missing[:len(free)], dtype=np.int8), (chains, 1)), axis=1)
+        if len(free) > 1:
+            free_by_box.append(free)
+
+    # Digit counts per row, column and box (one-hot reductions). Swaps keep
+    # the box counts, so only the row and column ones are maintained
+    digits = np.arange(size + 1, dtype=np.int8)
+    one_hot = boards.reshape(chains, size, size)[..., None] == digits
+    row_counts = one_hot.sum(axis=2, dtype=np.int32)
+    col_counts = one_hot.sum(axis=1, dtype=np.int32)
+    by_box = boards.reshape(chains, subgrid_size, subgrid_size, subgrid_size, subgrid_size)
+    by_box = by_box.transpose(0, 1, 3, 2, 4).reshape(chains, size, size)
+    box_counts = (by_box[..., None] == digits).sum(axis=2, dtype=np.int32)
+
+    def conflicts(counts):
+        return np.maximum(counts[..., 1:] - 1, 0).sum(axis=(1, 2))
+
+    scores = conflicts(row_counts) + conflicts(col_counts) + conflicts(box_counts)
+
+    best = int(np.argmin(scores))
+    best_score = int(scores[best])
+    best_solution = boards[best].copy()
+
+    if free_by_box and best_score > 0:
+        largest = max(len(free) for free in free_by_box)
+        free_cells = np.array([free + [0] * (largest - len(free)) for free in free_by_box])
+        free_counts = np.array([len(free) for free in free_by_box])
+        chain = np.arange(chains)
+
+        temperature = 1.0
+        while temperature > 0.0001:
+            if end_time is not None and time.perf_counter() >= end_time:
+                break
+
+            stats["iterations"] += 1
+
+            # One swap of two distinct free cells of a same box per chain
+            box = rng.integers(0, len(free_by_box), chains)
+            count = free_counts[box]
+            first_slot = (rng.random(chains) * count).astype(np.int64)
+            second_slot = (rng.random(chains) * (count - 1)).astype(np.int64)
+            second_slot += second_slot >= first_slot
+            a, b = free_cells[box, first_slot], free_cells[box, second_slot]
+            digit_a, digit_b = boards[chain, a], boards[chain, b]
+            row_a, row_b, col_a, col_b = row_of[a], row_of[b], col_of[a], col_of[b]
+
+            # Score change from the counts of the two rows and columns involved
+            delta = np.where(row_a != row_b,
+                             (row_counts[chain, row_a, digit_b] >= 1).astype(np.int32)
+                             - (row_counts[chain, row_a, digit_a] >= 2)
+                             + (row_counts[chain, row_b, digit_a] >= 1)
+                             - (row_counts[chain, row_b, digit_b] >= 2), 0)
+            delta += np.where(col_a != col_b,
+                              (col_counts[chain, col_a, digit_b] >= 1).astype(np.int32)
+                              - (col_counts[chain, col_a, digit_a] >= 2)
+                              + (col_counts[chain, col_b, digit_a] >= 1)
+                              - (col_counts[chain, col_b, digit_b] >= 2), 0)
+            delta[digit_a == digit_b] = 0
+
+            accept = (delta <= 0) | (rng.random(chains) < np.exp(-np.maximum(delta, 0) / temperature))
+            k, a, b, digit_a, digit_b = chain[accept], a[accept], b[accept], digit_a[accept], digit_b[accept]
+            row_a, row_b, col_a, col_b = row_a[accept], row_b[accept], col_a[accept], col_b[accept]
+
+            boards[k, a], boards[k, b] = digit_b, digit_a
+            row_counts[k, row_a, digit_a] -= 1
+            row_counts[k, row_a, digit_b] += 1
+            row_counts[k, row_b, digit_b] -= 1
+            row_counts[k, row_b, digit_a] += 1
+            col_counts[k, col_a, digit_a] -= 1
+            col_counts[k, col_a, digit_b] += 1
+            col_counts[k, col_b, digit_b] -= 1
+            col_counts[k, col_b, digit_a] += 1
+            scores[accept] += delta[accept]
+
+            best = int(np.argmin(scores))
+            if scores[best] < best_score:
+                best_score = int(scores[best])
+                best_solution = boards[best].copy()
+                if best_score == 0:
+                    break
+
+            temperature *= cooling_rate
+
+    return [list(map(int, best_solution[r * size:(r + 1) * size])) for r in range(size)], best_score
+
+
+@sudoku_engine
+def min_conflicts_solver(puzzle, max_iterations=200000, tabu_tenure=3, walk_probability=0.01,
+                         deadline=None, stats=None):
+    """
+    Min-conflicts local search with a tabu list, on the same SudokuBoard as
+    the annealer. As with the swap strategy, every box is first filled with
+    its missing digits, so that only rows and columns can conflict. Each step
+    picks a random conflicting non-given cell and gives it the digit with the
+    fewest conflicts, by swapping it with the free cell of its box holding
+    that digit (ties broken at random). A cell may not take back a digit it
+    left less than tabu_tenure steps ago, unless that beats the best score
+    so far (aspiration). With walk_probability, a random swap of the cell is
+    played instead, to escape the plateaus.
+
+    The search stops on a score of 0, or with the best board found after
+    max_iterations steps or deadline seconds.
+    """
+    end_time = deadline_time(deadline)
+
+    board = SudokuBoard(puzzle)
+    size, stride, cells = board.size, board.stride, board.cells
+    row_of, col_of = board.row_of, board.col_of
+    row_counts, col_counts = board.row_counts, board.col_counts
+    free_cells = list(board.empty)
+    fill_boxes(board, free_cells)
+
+    free_by_box = {}
+    for i in free_cells:
+        free_by_box.setdefault(board.box_of[i], []).append(i)
+    tabu = [0] * (size * size * stride)  # Step until which a cell may not take a digit back
+
+    def swap_delta(a, b):
+        """Score change of swapping the digits of the cells a and b of a
+        same box (box counts do not change)."""
+        digit_a, digit_b = cells[a], cells[b]
+        delta = 0
+        row_a, row_b = row_of[a] * stride, row_of[b] * stride
+        if row_a != row_b:
+            delta += (row_counts[row_a + digit_b] >= 1) - (row_counts[row_a + digit_a] >= 2) \
+                + (row_counts[row_b + digit_a] >= 1) - (row_counts[row_b + digit_b] >= 2)
+        col_a, col_b = col_of[a] * stride, col_of[b] * stride
+        if col_a != col_b:
+            delta += (col_counts[col_a + digit_b] >= 1) - (col_counts[col_a + digit_a] >= 2) \
+                + (col_counts[col_b + digit_a] >= 1) - (col_counts[col_b + digit_b] >= 2)
+        return delta
+
+    best_solution = board.to_lists()
+    best_score = board.score
+    iteration = 0
+    while best_score > 0:
+        if iteration >= max_iterations:
+            break
+        if end_time is not None and iteration & 63 == 0 and time.perf_counter() >= end_time:
+            break
+        iteration += 1
+        stats["iterations"] = iteration
+
+        conflicting = [i for i in free_cells
+                       if row_counts[row_of[i] * stride + cells[i]] > 1 or col_counts[col_of[i] * stride + cells[i]] > 1]
+        if not conflicting:
+            break  # Only givens are in conflict
+
+        a = random.choice(conflicting)
+        others = [b for b in free_by_box[board.box_of[a]] if cells[b] != cells[a]]
+        if not others:
+            continue
+        if random.random() < walk_probability:
+            b = random.choice(others)
+        else:
+            score = board.score
+            best_delta, chosen = None, []
+            for b in others:
+                delta = swap_delta(a, b)
+                if (tabu[a * stride + cells[b]] > iteration or tabu[b * stride + cells[a]] > iteration) \
+                        and score + delta >= best_score:
+                    continue
+                if best_delta is None or delta < best_delta:
+                    best_delta, chosen = delta, [b]
+                elif delta == best_delta:
+                    chosen.append(b)
+            if not chosen:
+                continue  # Every swap of this cell is tabu
+            b = random.choice(chosen)
+
+        digit_a, digit_b = cells[a], cells[b]
+        board.apply(((a, digit_a, digit_b), (b, digit_b, digit_a)))
+        tabu[a * stride + digit_a] = tabu[b * stride + digit_b] = iteration + tabu_tenure
+        if board.score < best_score:
+            best_score = board.score
+            best_solution = board.to_lists()
+
+    return best_solution, best_score
+
+
+ENGINES = {
+    "annealing": simulated_annealing_solver,
+    "tempering": parallel_tempering_solver,
+    "batch": batched_annealing_solver,
+    "dlx": dlx_solver,
+    "tabu": min_conflicts_solver,
+}
+
+
+def solve(initial_board, engine="annealing", **options):
+    """Solve the Sudoku with one of ENGINES, the options being passed to
+    its solver. Return the board and its score. Every engine presolves the
+    puzzle and, given a stats dict, stores the work it did in its
+    "iterations" entry (see sudoku_engine)."""
+    return ENGINES[engine](initial_board, **options)
+
+
+def add_engine_arguments(parser):
+    """Add the command line arguments selecting and tuning the engine."""
+    parser.add_argument("--engine", choices=list(ENGINES), default="annealing",
+                        help="annealing: one chain, tempering: parallel tempering over processes, "
+                             "batch: NumPy-batched chains, dlx: exact Dancing Links search, "
+                             "tabu: min-conflicts local search with a tabu list (default: annealing)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES),
+                        help="neighborhood used by the annealing and tempering engines "
+                             "(default: fill for annealing, swap for tempering)")
+    parser.add_argument("--schedule", choices=sorted(SCHEDULES), default="geometric",
+                        help="cooling schedule of the annealing engine (default: geometric)")
+    parser.add_argument("--deadline", type=float,
+                        help="stop after this many seconds and print the best board found so far "
+                             "(annealing, tempering, batch and tabu engines)")
+    parser.add_argument("--completion-score", type=int, default=4,
+                        help="score at which the annealing engine tries to finish the board exactly, "
+                             "0 to never try (default: 4)")
+    parser.add_argument("--no-presolve", action="store_true",
+                        help="search from the givens alone, without placing the cells they force first")
+    parser.add_argument("--fallback", action="store_true",
+                        help="hand a stalled annealing run off to the exact dlx engine")
+    parser.add_argument("--workers", type=int,
+                        help="processes used by the tempering engine (default: one per CPU)")
+    parser.add_argument("--replicas", type=int, default=8,
+                        help="number of parallel tempering replicas (default: 8)")
+    parser.add_argument("--chains", type=int, default=64,
+                        help="number of chains of the batch engine (default: 64)")
+    parser.add_argument("--tabu-tenure", type=int, default=3,
+                        help="steps during which the tabu engine may not put back a digit (default: 3)")
+
+
+def engine_options(args):
+    """Solver options of the engine selected by the command line arguments
+    (see add_engine_arguments)."""
+    options = {"propagate": not args.no_presolve}
+    if args.engine == "tempering":
+        options.update(workers=args.workers, replicas=args.replicas, strategy=args.strategy or "swap",
+                       deadline=args.deadline)
+    elif args.engine == "batch":
+        options.update(chains=args.chains, deadline=args.deadline)
+    elif args.engine == "tabu":
+        options.update(tabu_tenure=args.tabu_tenure, deadline=args.deadline)
+    elif args.engine == "annealing":
+        options.update(strategy=args.strategy or "fill", fallback=dlx_solver if args.fallback else None,
+                       schedule=SCHEDULES[args.schedule](), deadline=args.deadline,
+                       completion_score=args.completion_score)
+    return options
+
+
+# Symbols of the digits in the one character per cell format, base 36 beyond 9
+SYMBOLS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
 def print_board(board):
 
     """Print the Sudoku board."""
 
     for row in board:
-        print("".join(map(str, row)))
+        print("".join(SYMBOLS[digit] for digit in row))
 
  
 
+def parse_sudoku_row(line):
+    """Parse one row: either one character per cell, in base 36 for the
+    boards larger than 9x9 ('.' also marks an empty tile), or numbers
+    separated by spaces or commas."""
+    tokens = line.replace(",", " ").split()
+    if len(tokens) > 1:
+        return [int(token) for token in tokens]
+    return [0 if symbol == "." else int(symbol, 36) for symbol in line.strip()]
+
+
 def read_sudoku_from_file(file_path):
-    """Read Sudoku puzzle from a text file."""
+    """Read Sudoku puzzle from a text file. Any N^2 x N^2 size whose digits
+    all have a symbol (up to 25x25) is accepted."""
     
     with open(file_path, 'r') as file:
-        sudoku = [[int(num) for num in line.strip()] for line in file]
+        sudoku = [parse_sudoku_row(line) for line in file if line.strip()]
+
+    size = len(sudoku)
+    if math.isqrt(size) ** 2 != size or any(len(row) != size for row in sudoku):
+        raise ValueError("{} is not a N^2 x N^2 Sudoku".format(file_path))
+    if size > len(SYMBOLS) - 1:
+        raise ValueError("{} is larger than {} x {}".format(file_path, len(SYMBOLS) - 1, len(SYMBOLS) - 1))
+    if any(not 0 <= digit <= size for row in sudoku for digit in row):
+        raise ValueError("{} has digits outside 0 to {}".format(file_path, size))
 
     return sudoku
+
+
+def _corpus_lines(file_path):
+    """Lines of a corpus file as bytes: read through mmap for a plain file,
+    through a buffered gzip stream for a .gz file."""
+    with open(file_path, 'rb') as file:
+        gzipped = file.read(2) == b"\x1f\x8b"
+        if not gzipped:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from iter(mapped.readline, b"")
+            return
+
+    with gzip.open(file_path, 'rb') as file:
+        yield from file
+
+
+def read_sudoku_corpus(file_path, start=0, stop=None):
+    """Lazily read a corpus holding one puzzle per line (N^4 characters, '0'
+    or '.' for the empty tiles, in base 36 beyond 9x9), plain or
+    gzip-compressed. Only the lines of numbers start (included) to stop
+    (excluded), counted from 0, are read, so that a corpus can be sharded.
+    Yield (line number, board) pairs; anything after a comma or a space on a
+    line is ignored, as are the lines that are not a puzzle of at least 4x4
+    (headers, comments, counts, blank lines). A puzzle line with digits
+    beyond the size of its board raises a ValueError."""
+    for line_number, line in enumerate(_corpus_lines(file_path)):
+        if line_number < start:
+            continue
+        if stop is not None and line_number >= stop:
+            break
+
+        field = (line.split(b",", 1)[0].split(None, 1) or [b""])[0]
+        size = math.isqrt(len(field))
+        if size < 4 or size * size != len(field) or math.isqrt(size) ** 2 != size:
+            continue  # Not a N^2 x N^2 board with N >= 2
+        try:
+            cells = [0 if symbol == "." else int(symbol, 36) for symbol in field.decode("ascii")]
+        except (UnicodeDecodeError, ValueError):
+            continue
+        if max(cells) > size:
+            raise ValueError("{}:{} has digits outside 0 to {}".format(file_path, line_number, size))
+        yield line_number, [cells[row * size:(row + 1) * size] for row in range(size)]
  
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Solve a Sudoku with simulated annealing.")
+    parser.add_argument("instance", help="file holding the Sudoku, one line per row, 0 for empty tiles")
+    add_engine_arguments(parser)
+    parser.add_argument("--trace",
+                        help="write a trace of the annealing engine (calls, time, acceptance, trajectory) "
+                             "to this JSON or CSV file")
+    args = parser.parse_args()
+    if args.trace and args.engine != "annealing":
+        parser.error("--trace requires --engine annealing")
+
     # Reading Sudoku from file
-    initial_board = read_sudoku_from_file(sys.argv[1])
+    initial_board = read_sudoku_from_file(args.instance)
     """
     print_board(initial_board)
     print("\n\n")
@@ -204,7 +1513,12 @@ if __name__ == "__main__":
     # Solving Sudoku using simulated annealing
     start_timer = time.perf_counter()
 
-    solved_board, current_score = simulated_annealing_solver(initial_board)
+    if args.trace:
+        with SolverTrace() as trace:
+            solved_board, current_score = solve(initial_board, args.engine, trace=trace, **engine_options(args))
+        trace.save(args.trace)
+    else:
+        solved_board, current_score = solve(initial_board, args.engine, **engine_options(args))
 
     end_timer = time.perf_counter()
 
@@ -0,0 +1,186 @@
+"""
+Batch Sudoku runner: solves every puzzle of a directory or glob, or of
+one-puzzle-per-line corpus files, over a pool of processes and streams one
+JSON line per puzzle, as soon as it is solved:
+
+    {"instance": ..., "board": [rows], "score": ..., "iterations": ..., "elapsed": ...}
+
+A puzzle that cannot be read or solved gets an error record instead, and the
+batch goes on:
+
+    {"instance": ..., "error": "ValueError: ..."}
+
+Usage: python sudoku_batch.py instances/ --pool 4 --output results.jsonl
+       python sudoku_batch.py corpus.txt.gz --corpus --start 0 --stop 100000
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sudoku import *
+from sudoku_cache import SolutionCache
+
+
+def puzzle_files(patterns):
+    """Expand directories (every file inside) and glob patterns into a sorted
+    list of puzzle files."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files += [os.path.join(pattern, name) for name in os.listdir(pattern)
+                      if os.path.isfile(os.path.join(pattern, name))]
+        else:
+            files += [path for path in glob.glob(pattern) if os.path.isfile(path)]
+    return sorted(set(files))
+
+
+def file_puzzles(paths):
+    """Yield (name, board) for every puzzle file, the board being the
+    exception raised if the file is not a puzzle."""
+    for path in paths:
+        try:
+            yield path, read_sudoku_from_file(path)
+        except (OSError, UnicodeDecodeError, ValueError) as error:
+            yield path, error
+
+
+def corpus_puzzles(paths, start=0, stop=None):
+    """Yield (name, board) for every puzzle of the corpus files (one puzzle
+    per line, see read_sudoku_corpus), keeping only the lines start to stop
+    of each file. The name is the file and the line number."""
+    for path in paths:
+        for line_number, board in read_sudoku_corpus(path, start, stop):
+            yield "{}:{}".format(path, line_number), board
+
+
+def error_record(name, error):
+    """JSON record of a puzzle that could not be read or solved."""
+    return {"instance": name, "error": "{}: {}".format(type(error).__name__, error)}
+
+
+def solve_instance(task):
+    """Solve one puzzle and return its JSON record."""
+    name, initial_board, engine, options = task
+
+    stats = {}
+    start_timer = time.perf_counter()
+    solved_board, score = solve(initial_board, engine, stats=stats, **options)
+    end_timer = time.perf_counter()
+
+    return {
+        "instance": name,
+        "board": ["".join(SYMBOLS[digit] for digit in row) for row in solved_board],
+        "score": score,
+        "iterations": stats.get("iterations"),
+        "elapsed": end_timer - start_timer,
+    }
+
+
+def run_batch(puzzles, engine="annealing", workers=None, output=sys.stdout, cache=None, **options):
+    """Solve the (name, board) puzzles over workers processes (one per CPU by
+    default) and write their JSON records to output in completion order.
+    Puzzles are pulled from the iterable as workers free up, so a lazy
+    corpus is never loaded whole. If a SolutionCache is given, it is looked
+    up before solving and fed with the solutions found. A board that is an
+    exception (see file_puzzles), or a solver that raises one, gets an error
+    record. Return the number of puzzles solved."""
+    solved = 0
+    in_flight_limit = 4 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        boards = {}  # Name and puzzle of each pending future
+        puzzles = iter(puzzles)
+        exhausted = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < in_flight_limit:
+                try:
+                    name, board = next(puzzles)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                if isinstance(board, Exception):
+                    output.write(json.dumps(error_record(name, board)) + "\n")
+                    continue
+
+                if cache is not None:
+                    start_timer = time.perf_counter()
+                    solution = cache.get(board)
+                    if solution is not None:
+                        record = {
+                            "instance": name,
+                            "board": ["".join(SYMBOLS[digit] for digit in row) for row in solution],
+                            "score": 0,
+                            "iterations": 0,
+                            "elapsed": time.perf_counter() - start_timer,
+                            "cached": True,
+                        }
+                        output.write(json.dumps(record) + "\n")
+                        solved += 1
+                        continue
+
+                future = executor.submit(solve_instance, (name, board, engine, options))
+                pending.add(future)
+                boards[future] = name, board
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, board = boards.pop(future)
+                try:
+                    record = future.result()
+                except Exception as error:
+                    output.write(json.dumps(error_record(name, error)) + "\n")
+                    continue
+                if cache is not None and record["score"] == 0:
+                    cache.put(board, [parse_sudoku_row(row) for row in record["board"]])
+                output.write(json.dumps(record) + "\n")
+                solved += 1
+            output.flush()
+
+    return solved
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Solve many Sudoku files over a pool of processes.")
+    parser.add_argument("paths", nargs="+", help="puzzle files, directories or glob patterns")
+    parser.add_argument("--corpus", action="store_true",
+                        help="the files are corpora with one puzzle per line, plain or gzip-compressed")
+    parser.add_argument("--start", type=int, default=0,
+                        help="first line of each corpus to solve, counted from 0 (default: 0)")
+    parser.add_argument("--stop", type=int,
+                        help="line of each corpus to stop before (default: end of file)")
+    parser.add_argument("--output", help="JSONL file to write (default: standard output)")
+    parser.add_argument("--pool", type=int, help="processes solving puzzles (default: one per CPU)")
+    parser.add_argument("--cache", help="persistent solution cache file, shared by repeated and isomorphic puzzles")
+    parser.add_argument("--cache-size", type=int, default=10000,
+                        help="entries kept in memory by the solution cache (default: 10000)")
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    if args.engine == "tempering":
+        parser.error("the tempering engine runs its own pool, use it on a single puzzle")
+
+    paths = puzzle_files(args.paths)
+    if args.corpus:
+        puzzles = corpus_puzzles(paths, args.start, args.stop)
+    else:
+        puzzles = file_puzzles(paths)
+    options = engine_options(args)
+    cache = SolutionCache(args.cache_size, args.cache) if args.cache else None
+
+    try:
+        if args.output:
+            with open(args.output, "w") as output:
+                run_batch(puzzles, args.engine, args.pool, output, cache, **options)
+        else:
+            run_batch(puzzles, args.engine, args.pool, cache=cache, **options)
+    finally:
+        if cache is not None:
+            cache.close()
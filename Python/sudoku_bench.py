@@ -0,0 +1,151 @@
+"""
+Sudoku benchmark: solves every instance once per seed and reports, per
+instance, the iterations per second, the success rate (runs reaching a
+score of 0) and the p50 / p95 / max time-to-solution of the successful runs.
+
+The results can be saved as a JSON baseline, and a later run compared to it:
+every instance slower or less successful than the baseline by more than the
+threshold is reported as a regression (and the exit status is 1).
+
+Presolving alone solves the shipped instances, leaving nothing to the search
+(their iterations per second are then reported as "-"): run with
+--no-presolve, or on a harder corpus made by sudoku_gen, to time the engine.
+
+Usage: python sudoku_bench.py --seeds 0 1 2 3 4 --save baseline.json
+       python sudoku_bench.py --seeds 0 1 2 3 4 --compare baseline.json
+       python sudoku_bench.py --engine tabu --save tabu.json
+       python sudoku_bench.py --no-presolve --seeds 0 1 2 --save search.json
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from sudoku import *
+
+INSTANCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "instances", "i{:02d}".format(k))
+             for k in range(1, 11)]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def run_instance(path, seeds, engine="annealing", **options):
+    """Solve the instance once per seed and return its statistics. The
+    iterations per second are None if no run searched at all."""
+    initial_board = read_sudoku_from_file(path)
+    times, iterations, successes = [], 0, 0
+    elapsed_total = 0.0
+
+    for seed in seeds:
+        random.seed(seed)
+        # Options like the schedule are stateful, each run gets fresh ones
+        run_options = copy.deepcopy(options)
+        if engine == "batch":
+            run_options["seed"] = seed
+
+        stats = {}
+        start_timer = time.perf_counter()
+        _, score = solve(initial_board, engine, stats=stats, **run_options)
+        elapsed = time.perf_counter() - start_timer
+
+        elapsed_total += elapsed
+        iterations += stats.get("iterations") or 0
+        if score == 0:
+            successes += 1
+            times.append(elapsed)
+
+    return {
+        "runs": len(seeds),
+        "iterations_per_second": iterations / elapsed_total if iterations and elapsed_total else None,
+        "success_rate": successes / len(seeds),
+        "p50": percentile(times, 50) if times else None,
+        "p95": percentile(times, 95) if times else None,
+        "max": max(times) if times else None,
+    }
+
+
+def run_benchmark(paths, seeds, engine="annealing", **options):
+    """Return the statistics of every instance, keyed by instance name."""
+    return {os.path.basename(path): run_instance(path, seeds, engine, **options) for path in paths}
+
+
+def regressions(results, baseline, threshold=0.2):
+    """List the regressions of results against baseline: a success rate
+    lower by more than threshold, or a p50 / p95 time-to-solution higher
+    (iterations per second lower) by more than threshold, in relative terms."""
+    found = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        if current["success_rate"] < previous["success_rate"] - threshold:
+            found.append("{}: success rate {:.0%} -> {:.0%}".format(
+                name, previous["success_rate"], current["success_rate"]))
+        for key in ("p50", "p95"):
+            if previous[key] and current[key] and current[key] > previous[key] * (1 + threshold):
+                found.append("{}: {} {:.4f}s -> {:.4f}s".format(name, key, previous[key], current[key]))
+        if previous["iterations_per_second"] and current["iterations_per_second"] \
+                and current["iterations_per_second"] < previous["iterations_per_second"] * (1 - threshold):
+            found.append("{}: iterations/s {:.0f} -> {:.0f}".format(
+                name, previous["iterations_per_second"], current["iterations_per_second"]))
+    return found
+
+
+def print_results(results):
+    def cell(value, pattern):
+        return "-" if value is None else pattern.format(value)
+
+    print("{:<10} {:>12} {:>8} {:>9} {:>9} {:>9}".format("instance", "iter/s", "success", "p50", "p95", "max"))
+    for name, stats in results.items():
+        print("{:<10} {:>12} {:>8} {:>9} {:>9} {:>9}".format(
+            name, cell(stats["iterations_per_second"], "{:.0f}"), "{:.0%}".format(stats["success_rate"]),
+            cell(stats["p50"], "{:.4f}"), cell(stats["p95"], "{:.4f}"), cell(stats["max"], "{:.4f}")))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the Sudoku solver on the instances.")
+    parser.add_argument("paths", nargs="*", default=INSTANCES, help="instances to run (default: instances/i01-i10)")
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(range(5)),
+                        help="random seeds, one run per seed and instance (default: 0 to 4)")
+    parser.add_argument("--save", help="write the results to this JSON baseline file")
+    parser.add_argument("--compare", help="JSON baseline file to flag the regressions against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change counted as a regression (default: 0.2)")
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    setup = {"engine": args.engine, "seeds": args.seeds, "presolve": not args.no_presolve}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        baseline.setdefault("presolve", True)  # Saved before the option existed
+        # Runs of another engine, seeds or presolve setting are not comparable
+        mismatches = ["{} {} (baseline: {})".format(key, value, baseline.get(key))
+                      for key, value in setup.items() if baseline.get(key) != value]
+        if mismatches:
+            parser.error("cannot compare against {}: {}".format(args.compare, ", ".join(mismatches)))
+
+    results = run_benchmark(args.paths, args.seeds, args.engine, **engine_options(args))
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(dict(setup, instances=results), file, indent=2)
+
+    if args.compare:
+        found = regressions(results, baseline["instances"], args.threshold)
+        for line in found:
+            print("REGRESSION", line)
+        if found:
+            sys.exit(1)
@@ -0,0 +1,264 @@
+"""
+Solution cache for repeated and isomorphic Sudoku puzzles.
+
+Two puzzles are isomorphic when one is obtained from the other by relabeling
+the digits, permuting the bands, the stacks, the rows inside a band, the
+columns inside a stack, and transposing. Every puzzle is mapped to the
+canonical form of its class (its minimal lexicographic representative),
+solutions are stored in the canonical frame, and a hit is mapped back to the
+frame of the incoming puzzle.
+"""
+
+import itertools
+import shelve
+from collections import OrderedDict
+
+from sudoku import *
+
+
+class Transform:
+    """Maps a board to the canonical frame: row k, column c of the canonical
+    board is row rows[k], column cols[c] of the board (transposed first if
+    transposed is set), its digits relabeled by labels (label 0 is kept for
+    the empty tiles)."""
+
+    def __init__(self, transposed, rows, cols, labels):
+        self.transposed = transposed
+        self.rows = rows
+        self.cols = cols
+        self.labels = labels
+
+    def forward(self, board):
+        grid = transpose(board) if self.transposed else board
+        return [[self.labels[grid[row][col]] for col in self.cols] for row in self.rows]
+
+    def backward(self, board):
+        size = len(board)
+        inverse = [0] * len(self.labels)
+        for digit, label in enumerate(self.labels):
+            inverse[label] = digit
+
+        grid = [[0] * size for _ in range(size)]
+        for k, row in enumerate(self.rows):
+            for c, col in enumerate(self.cols):
+                grid[row][col] = inverse[board[k][c]]
+        return transpose(grid) if self.transposed else grid
+
+
+def transpose(board):
+    return [list(column) for column in zip(*board)]
+
+
+def _first_row_column_orders(row, subgrid_size):
+    """All the column orders giving the minimal relabeled first row: the
+    stacks with the most empty tiles first, and the empty tiles first inside
+    each stack. Digits of a row are distinct, so once relabeled only the
+    positions of the empty tiles matter."""
+    stacks = [list(range(s * subgrid_size, (s + 1) * subgrid_size)) for s in range(subgrid_size)]
+    empties = [sum(1 for col in stack if row[col] == 0) for stack in stacks]
+
+    # Stacks with the same number of empty tiles can come in any order
+    groups = [[s for s in range(subgrid_size) if empties[s] == count]
+              for count in sorted(set(empties), reverse=True)]
+    stack_orders = [[s for group in order for s in group]
+                    for order in itertools.product(*(itertools.permutations(group) for group in groups))]
+
+    inside = []
+    for stack in stacks:
+        zeros = [col for col in stack if row[col] == 0]
+        digits = [col for col in stack if row[col] != 0]
+        inside.append([list(a) + list(b)
+                       for a in itertools.permutations(zeros) for b in itertools.permutations(digits)])
+
+    orders = []
+    for stack_order in stack_orders:
+        for parts in itertools.product(*(inside[s] for s in stack_order)):
+            orders.append([col for part in parts for col in part])
+    return orders
+
+
+def canonical_form(board, max_candidates=5000):
+    """Return the canonical form of the puzzle (a tuple of rows) and the
+    Transform mapping the puzzle to it. The search goes row by row and only
+    keeps the partial transforms giving the smallest rows so far. Very
+    symmetric puzzles (e.g. nearly empty ones) keep too many of them: None is
+    returned when more than max_candidates are kept."""
+    size = len(board)
+    subgrid_size = math.isqrt(size)
+    grids = [(False, board), (True, transpose(board))]
+
+    # First row: the rows with the most empty tiles, ordered by stacks
+    best_pattern = None
+    candidates = []
+    for transposed, grid in grids:
+        for first in range(size):
+            zeros = sorted((sum(1 for col in range(s * subgrid_size, (s + 1) * subgrid_size) if grid[first][col] == 0)
+                            for s in range(subgrid_size)), reverse=True)
+            pattern = tuple(0 if k < count else 1 for count in zeros for k in range(subgrid_size))
+            if best_pattern is None or pattern < best_pattern:
+                best_pattern, candidates = pattern, []
+            if pattern == best_pattern:
+                for cols in _first_row_column_orders(grid[first], subgrid_size):
+                    labels = {0: 0}
+                    for col in cols:
+                        if grid[first][col]:
+                            labels[grid[first][col]] = len(labels)
+                    candidates.append((transposed, grid, [first], cols, labels))
+            if len(candidates) > max_candidates:
+                return None
+
+    _, grid, rows, cols, labels = candidates[0]
+    canonical = [tuple(labels[grid[rows[0]][col]] for col in cols)]
+
+    # Next rows: any row of an unused band to open a band, else any unused
+    # row of the current band
+    for k in range(1, size):
+        best_row, extended = None, []
+        for transposed, grid, rows, cols, labels in candidates:
+            band = rows[-1] // subgrid_size
+            if k % subgrid_size == 0:
+                used_bands = {row // subgrid_size for row in rows}
+                options = [row for row in range(size) if row // subgrid_size not in used_bands]
+            else:
+                options = [row for row in range(band * subgrid_size, (band + 1) * subgrid_size) if row not in rows]
+
+            for row in options:
+                new_labels = labels
+                relabeled = []
+                for col in cols:
+                    digit = grid[row][col]
+                    if digit not in new_labels:
+                        if new_labels is labels:
+                            new_labels = dict(labels)
+                        new_labels[digit] = len(new_labels)
+                    relabeled.append(new_labels[digit])
+                relabeled = tuple(relabeled)
+
+                if best_row is None or relabeled < best_row:
+                    best_row, extended = relabeled, []
+                if relabeled == best_row:
+                    extended.append((transposed, grid, rows + [row], cols, new_labels))
+                    if len(extended) > max_candidates:
+                        return None
+        canonical.append(best_row)
+        candidates = extended
+
+    transposed, _, rows, cols, labels = candidates[0]
+    # Digits missing from the puzzle take the remaining labels in order
+    for digit in range(1, size + 1):
+        if digit not in labels:
+            labels[digit] = len(labels)
+    label_list = [0] * (size + 1)
+    for digit, label in labels.items():
+        label_list[digit] = label
+
+    return tuple(canonical), Transform(transposed, rows, cols, label_list)
+
+
+class SolutionCache:
+    """Cache of solved puzzles, keyed by canonical form, with LRU eviction
+    beyond max_size entries. If path is given, the entries are also kept in
+    a persistent shelve store at that path, which is consulted on a miss.
+
+    Exact repeats of a puzzle are found from its raw form without computing
+    the canonical form. Puzzles larger than 9x9, or too symmetric to get a
+    canonical form, are only cached under their raw form."""
+
+    def __init__(self, max_size=10000, path=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # Canonical form -> canonical solution
+        self.raw = OrderedDict()  # Raw puzzle -> solution in its own frame
+        self.store = shelve.open(path) if path is not None else None
+        self.hits = self.misses = 0
+        self._last = (None, None)  # Raw puzzle and canonical form of the last miss
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _raw_key(board):
+        return bytes(digit for row in board for digit in row)
+
+    def _remember(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_size:
+            table.popitem(last=False)
+
+    def _canonical_form(self, raw_key, board):
+        """Canonical form of the puzzle, reused between a miss and the put()
+        that follows it. Only computed up to 9x9."""
+        if self._last[0] == raw_key:
+            return self._last[1]
+        form = canonical_form(board) if len(board) <= 9 else None
+        self._last = (raw_key, form)
+        return form
+
+    def get(self, board):
+        """Return the cached solution of the puzzle in its own frame, or
+        None."""
+        raw_key = self._raw_key(board)
+        if raw_key in self.raw:
+            self.raw.move_to_end(raw_key)
+            self.hits += 1
+            return [row[:] for row in self.raw[raw_key]]
+
+        form = self._canonical_form(raw_key, board)
+        if form is None:
+            self.misses += 1
+            return None
+
+        canonical, transform = form
+        solution = self.entries.get(canonical)
+        if solution is not None:
+            self.entries.move_to_end(canonical)
+        elif self.store is not None and canonical_key(canonical) in self.store:
+            solution = self.store[canonical_key(canonical)]
+            self._remember(self.entries, canonical, solution)
+        if solution is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        solved = transform.backward(solution)
+        self._remember(self.raw, raw_key, solved)
+        return [row[:] for row in solved]
+
+    def put(self, board, solution):
+        """Store the solution of the puzzle."""
+        raw_key = self._raw_key(board)
+        self._remember(self.raw, raw_key, [row[:] for row in solution])
+        form = self._canonical_form(raw_key, board)
+        if form is None:
+            return
+
+        canonical, transform = form
+        canonical_solution = transform.forward(solution)
+        self._remember(self.entries, canonical, canonical_solution)
+        if self.store is not None:
+            self.store[canonical_key(canonical)] = canonical_solution
+
+    def solve(self, initial_board, solver=simulated_annealing_solver, **options):
+        """Return the cached solution and a score of 0 on a hit, else solve
+        the puzzle with solver and cache the result if it is a solution."""
+        solution = self.get(initial_board)
+        if solution is not None:
+            return solution, 0
+
+        solved_board, score = solver(initial_board, **options)
+        if score == 0:
+            self.put(initial_board, solved_board)
+        return solved_board, score
+
+
+def canonical_key(canonical):
+    """Key of a canonical form in the persistent store."""
+    return "".join(SYMBOLS[digit] for row in canonical for digit in row)
@@ -0,0 +1,156 @@
+"""
+Sudoku puzzle generator, to build benchmark corpora larger than the ten
+shipped instances.
+
+A complete grid is built by a randomized fill (independent random diagonal
+boxes, completed by Dancing Links), then clues are removed in random order,
+a removal being kept only if the puzzle still has a unique solution. Puzzles
+are generated over a pool of processes and written either as instance files
+(one line per row, like instances/) or as a corpus with one puzzle per line
+(see read_sudoku_corpus).
+
+Usage: python sudoku_gen.py --count 1000 --difficulty hard --output corpus.txt.gz
+       python sudoku_gen.py --count 50 --clues 30 --format instance --output generated/
+"""
+
+import argparse
+import gzip
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from sudoku import *
+
+# Share of the cells kept as clues at each difficulty level
+DIFFICULTIES = {
+    "easy": 0.5,
+    "medium": 0.4,
+    "hard": 0.3,
+}
+
+
+def random_grid(size=9, rng=random):
+    """Return a random complete size x size grid: the diagonal boxes, which
+    share no unit, are filled with random permutations and Dancing Links
+    completes the rest (new boxes are drawn in the rare case it cannot, as
+    on 4x4 boards)."""
+    subgrid_size = math.isqrt(size)
+    solutions = []
+    while not solutions:
+        grid = [[0] * size for _ in range(size)]
+        for box in range(subgrid_size):
+            digits = rng.sample(range(1, size + 1), size)
+            for k, digit in enumerate(digits):
+                grid[box * subgrid_size + k // subgrid_size][box * subgrid_size + k % subgrid_size] = digit
+        solutions = sudoku_exact_cover(grid).solve()
+
+    for i, digit in solutions[0]:
+        grid[i // size][i % size] = digit
+    return grid
+
+
+def has_unique_solution(board):
+    """Does the puzzle have exactly one solution?"""
+    # Propagation pays off beyond 9x9 only, where it prunes most of the search
+    puzzle = presolve(board) if len(board) > 9 else board
+    return puzzle is not None and len(sudoku_exact_cover(puzzle).solve(2)) == 1
+
+
+def remove_clues(grid, clues, rng=random):
+    """Return a puzzle of the complete grid with clues clues left, removed in
+    random order while the solution stays unique. If no cell can be removed
+    anymore before reaching clues, the puzzle is minimal and has more."""
+    size = len(grid)
+    puzzle = [row[:] for row in grid]
+    cells = [(row, col) for row in range(size) for col in range(size)]
+    rng.shuffle(cells)
+
+    remaining = size * size
+    for row, col in cells:
+        if remaining <= clues:
+            break
+        digit, puzzle[row][col] = puzzle[row][col], 0
+        if has_unique_solution(puzzle):
+            remaining -= 1
+        else:
+            puzzle[row][col] = digit
+    return puzzle
+
+
+def target_clues(size, difficulty="medium"):
+    """Number of clues of a size x size puzzle at one of DIFFICULTIES."""
+    return round(DIFFICULTIES[difficulty] * size * size)
+
+
+def generate_puzzle(size=9, clues=None, difficulty="medium", seed=None):
+    """Generate a puzzle with a unique solution and clues clues (by default,
+    the clue count of the difficulty level). Return the puzzle and its
+    solution."""
+    rng = random.Random(seed)
+    if clues is None:
+        clues = target_clues(size, difficulty)
+    grid = random_grid(size, rng)
+    return remove_clues(grid, clues, rng), grid
+
+
+def _generate_task(task):
+    size, clues, seed = task
+    puzzle, _ = generate_puzzle(size, clues, seed=seed)
+    return puzzle
+
+
+def generate_puzzles(count, size=9, clues=None, difficulty="medium", workers=None, seed=None):
+    """Yield count puzzles, generated over workers processes (one per CPU by
+    default). With a seed, puzzle k is generated from seed + k, so that the
+    output is reproducible whatever the number of workers."""
+    if clues is None:
+        clues = target_clues(size, difficulty)
+    tasks = ((size, clues, None if seed is None else seed + k) for k in range(count))
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(_generate_task, tasks, chunksize=8)
+
+
+def corpus_line(board):
+    """The puzzle as one line of the corpus format, '0' for empty tiles."""
+    return "".join(SYMBOLS[digit] for row in board for digit in row)
+
+
+def write_instance(board, file_path):
+    """Write the puzzle in the format of instances/, one line per row."""
+    with open(file_path, "w") as file:
+        for row in board:
+            file.write("".join(SYMBOLS[digit] for digit in row) + "\n")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate Sudoku puzzles with a unique solution.")
+    parser.add_argument("--count", type=int, default=100, help="number of puzzles (default: 100)")
+    parser.add_argument("--size", type=int, default=9, help="side of the board, a square (default: 9)")
+    parser.add_argument("--clues", type=int, help="clues left in every puzzle (default: set by --difficulty)")
+    parser.add_argument("--difficulty", choices=list(DIFFICULTIES), default="medium",
+                        help="clue count level, {} (default: medium)".format(
+                            ", ".join("{}: {:.0%} of the cells".format(name, share)
+                                      for name, share in DIFFICULTIES.items())))
+    parser.add_argument("--format", choices=["corpus", "instance"], default="corpus",
+                        help="corpus: one puzzle per line in a single file (gzip-compressed if it ends "
+                             "with .gz), instance: one file per puzzle in a directory (default: corpus)")
+    parser.add_argument("--output", required=True, help="corpus file or instance directory to write")
+    parser.add_argument("--pool", type=int, help="processes generating puzzles (default: one per CPU)")
+    parser.add_argument("--seed", type=int, help="seed making the output reproducible")
+    args = parser.parse_args()
+
+    if math.isqrt(args.size) ** 2 != args.size or not 4 <= args.size <= len(SYMBOLS) - 1:
+        parser.error("the size must be a square between 4 and {}".format(len(SYMBOLS) - 1))
+
+    puzzles = generate_puzzles(args.count, args.size, args.clues, args.difficulty, args.pool, args.seed)
+    if args.format == "instance":
+        os.makedirs(args.output, exist_ok=True)
+        width = len(str(args.count))
+        for k, puzzle in enumerate(puzzles, 1):
+            write_instance(puzzle, os.path.join(args.output, "g{:0{}d}".format(k, width)))
+    else:
+        opener = gzip.open if args.output.endswith(".gz") else open
+        with opener(args.output, "wt") as file:
+            for puzzle in puzzles:
+                file.write(corpus_line(puzzle) + "\n")